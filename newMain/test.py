@@ -1,55 +1,296 @@
 # product_extractor.py
+import os
+import json
 import re
 import time
-import json
+import asyncio
+import hashlib
+import heapq
+import logging
+import tempfile
+import threading
+from collections import deque
+from contextlib import aclosing, asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from itertools import islice
+from operator import itemgetter
 from typing import List, Dict, Tuple
+import aiohttp
+import cachetools
+import httpx
+import msgpack
+import orjson
+import requests_cache
 import wikipediaapi
-import wikipedia
-import requests
-from bs4 import BeautifulSoup
+from aiohttp_client_cache import CachedSession, SQLiteBackend
 from fastapi import FastAPI, Query
-from pydantic import BaseModel
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from selectolax.parser import HTMLParser
+from yarl import URL
+
+WIKI_API_URL = "https://en.wikipedia.org/w/api.php"
+USER_AGENT = "product-extractor/1.0"
+logger = logging.getLogger(__name__)
+WIKI_CACHE_TTL = 86400  # seconds; category trees and link lists change slowly
+# on-disk caches live next to this module, not in whatever the working directory is
+CACHE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# wikipediaapi talks through `requests`, so this transparently caches its HTTP calls on disk
+requests_cache.install_cache(os.path.join(CACHE_DIR, 'wiki_cache.sqlite'), backend='sqlite', expire_after=WIKI_CACHE_TTL)
+
+wiki_api = wikipediaapi.Wikipedia(user_agent=USER_AGENT, language='en')
+# wikipediaapi is blocking: its calls run on this pool (rate-limited by _WIKI_SEM, see below)
+_EXEC = ThreadPoolExecutor(max_workers=16)
+
+# shared Wikipedia API session, opened in the app lifespan (or lazily on first use from the CLI).
+# Responses are cached on disk keyed by URL.
+_SESSION: aiohttp.ClientSession = None
+
+def _get_session() -> aiohttp.ClientSession:
+    global _SESSION
+    if _SESSION is None or _SESSION.closed:
+        _SESSION = CachedSession(
+            cache=SQLiteBackend(os.path.join(CACHE_DIR, 'wiki_cache_async.sqlite'), expire_after=WIKI_CACHE_TTL),
+            headers={"User-Agent": USER_AGENT},
+            timeout=aiohttp.ClientTimeout(total=10),
+        )
+    return _SESSION
+
+# retailer pages go through a pooled HTTP/2 client: keep-alive TLS and multiplexing
+# when several category pages of the same retailer are fetched
+_HTTP: httpx.AsyncClient = None
+
+def _get_http() -> httpx.AsyncClient:
+    global _HTTP
+    if _HTTP is None or _HTTP.is_closed:
+        _HTTP = httpx.AsyncClient(
+            http2=True,
+            timeout=10.0,
+            follow_redirects=True,
+            limits=httpx.Limits(max_keepalive_connections=20),
+            headers={"User-Agent": "Mozilla/5.0 (compatible; product-extractor/1.0)"},
+        )
+    return _HTTP
+
+async def _close_clients():
+    global _SESSION, _HTTP
+    if _SESSION is not None and not _SESSION.closed:
+        await _SESSION.close()
+    if _HTTP is not None and not _HTTP.is_closed:
+        await _HTTP.aclose()
+    _SESSION = None
+    _HTTP = None
 
-wiki_api = wikipediaapi.Wikipedia(user_agent='product-extractor/1.0', language='en')
-app = FastAPI(title="Product Name Extractor (wiki-first)")
+# whole-request results: (main, sub, subsub, retailer_url) -> (saved_at, aggregated items),
+# kept in memory and persisted as msgpack across restarts
+RESULT_CACHE_TTL = 3600
+RESULT_CACHE_PATH = os.path.join(CACHE_DIR, "results.msgpack")
+_RESULT_CACHE = cachetools.TTLCache(maxsize=10_000, ttl=RESULT_CACHE_TTL)
+
+def _result_key(main: str, sub: str, subsub: str, retailer_url: str) -> str:
+    # blake2b: fast, and collision resistance is plenty for a cache key. Hash a JSON array,
+    # not a joined string, so None != "None" and a "|" inside a field can't shift the others
+    return hashlib.blake2b(orjson.dumps([main, sub, subsub, retailer_url]), digest_size=16).hexdigest()
+
+def _load_result_cache(path: str = RESULT_CACHE_PATH):
+    try:
+        with open(path, "rb") as f:
+            entries = msgpack.unpackb(f.read())
+    except Exception:
+        return
+    now = time.time()
+    for key, (saved_at, items) in entries.items():
+        if now - saved_at < RESULT_CACHE_TTL:
+            _RESULT_CACHE[key] = (saved_at, items)
+
+def _dump_result_cache(path: str = RESULT_CACHE_PATH):
+    # write a sibling temp file and swap it in, so a crash or a concurrent worker
+    # never leaves a truncated cache behind; a failed save is logged, never raised
+    tmp_path = None
+    try:
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".results-", suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(msgpack.packb(dict(_RESULT_CACHE.items())))
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning("could not save result cache to %s: %s", path, e)
+        if tmp_path is not None:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+
+@asynccontextmanager
+async def _lifespan(app: FastAPI):
+    _load_result_cache()
+    _get_session()
+    _get_http()
+    try:
+        yield
+    finally:
+        await _close_clients()
+        _dump_result_cache()
+
+app = FastAPI(title="Product Name Extractor (wiki-first)", default_response_class=ORJSONResponse, lifespan=_lifespan)
 
 # ----- Helpers -----
+_WS_RE = re.compile(r'\s+')
+_TRAIL = ' -–—:;,.'
+
+@lru_cache(maxsize=8192)
 def normalize_name(name: str) -> str:
-    name = name.strip()
-    # remove excessive whitespace and newlines
-    name = re.sub(r'\s+', ' ', name)
-    # remove trailing punctuation
-    name = name.strip(' -–—:;,.')
-    return name
+    # collapse whitespace/newlines, then trim surrounding punctuation
+    # (memoized: popular link titles recur across stages and requests)
+    return _WS_RE.sub(' ', name.strip()).strip(_TRAIL)
+
+def _note_error(errors: list, exc: Exception):
+    # stages degrade to partial results on failure; callers that care pass a list to hear about it
+    if errors is not None:
+        errors.append(exc)
 
 def unique_preserve_order(seq):
-    seen = set()
-    out = []
-    for item in seq:
-        if item not in seen:
-            seen.add(item)
-            out.append(item)
+    # dicts keep insertion order, so this dedupes in C in a single pass
+    return list(dict.fromkeys(seq))
+
+# ----- MediaWiki API (async) -----
+# cap in-flight requests so gather() fan-out stays polite and doesn't trip 429s.
+# This is the one budget for all Wikipedia traffic: category traversals (one request
+# at a time on the thread pool) hold a slot until their thread finishes, see _run_wiki_blocking.
+_WIKI_SEM = asyncio.Semaphore(8)
+
+def _release_wiki_slot(fut: asyncio.Future):
+    _WIKI_SEM.release()
+    if not fut.cancelled():
+        fut.exception()  # nobody may await it after a cancel; mark it seen
+
+async def _run_wiki_blocking(fn, *args):
+    """
+    Run a blocking wikipediaapi call on _EXEC under a _WIKI_SEM slot. Cancelling the caller
+    doesn't stop the thread, so the slot is only released once the thread is done.
+    """
+    await _WIKI_SEM.acquire()
+    try:
+        fut = asyncio.get_running_loop().run_in_executor(_EXEC, fn, *args)
+    except BaseException:
+        _WIKI_SEM.release()
+        raise
+    fut.add_done_callback(_release_wiki_slot)
+    return await asyncio.shield(fut)
+WIKI_BATCH_SIZE = 50  # max titles per query the API accepts from regular clients
+_MISSING_PAGE = {"exists": False, "links": []}
+# titles known not to exist (most guessed category names); skipped without a round-trip
+_NEG_CACHE = cachetools.TTLCache(maxsize=10000, ttl=3600)
+
+class WikiAPIError(Exception):
+    """MediaWiki reported an error in the body of an HTTP 200 reply."""
+
+async def _wiki_get(session: aiohttp.ClientSession, params: Dict) -> Dict:
+    """GET the MediaWiki API and return its JSON, raising on HTTP and API-level errors."""
+    # full URL (not params=) so the cache entry can be dropped under the exact same key
+    url = str(URL(WIKI_API_URL).with_query(params))
+    async with _WIKI_SEM, session.get(url) as resp:
+        resp.raise_for_status()
+        data = await resp.json()
+    if "error" in data:
+        # the session caches any 200; don't let it replay this error for WIKI_CACHE_TTL
+        await session.cache.delete_url(url)
+        err = data["error"]
+        raise WikiAPIError(f"{err.get('code')}: {err.get('info')}")
+    return data
+
+async def _afetch_batch(session: aiohttp.ClientSession, titles: List[str], links: bool) -> Dict[str, Dict]:
+    params = {
+        "action": "query", "titles": "|".join(titles), "prop": "links|categoryinfo" if links else "categoryinfo",
+        "pllimit": "max", "format": "json", "formatversion": "2",
+    }
+    normalized = {}
+    pages = {}
+    while True:
+        data = await _wiki_get(session, params)
+        query = data.get("query", {})
+        for n in query.get("normalized", []):
+            normalized[n["from"]] = n["to"]
+        for page in query.get("pages", []):
+            entry = pages.setdefault(page["title"], {
+                "exists": not page.get("missing") and not page.get("invalid"),
+                "missing": bool(page.get("missing")), "links": [],
+            })
+            entry["links"].extend(l["title"] for l in page.get("links", []))
+        # follow plcontinue until every page's links are in
+        if "continue" not in data:
+            break
+        params = {**params, **data["continue"]}
+    return {t: pages.get(normalized.get(t, t), _MISSING_PAGE) for t in titles}
+
+async def abatch_fetch_pages(session: aiohttp.ClientSession, titles: List[str], links: bool = True) -> Dict[str, Dict]:
+    """
+    Fetch existence (and outgoing link titles) for many pages, WIKI_BATCH_SIZE titles per request.
+    Returns {requested title: {"exists": bool, "links": [...]}}; entries the API explicitly
+    reported as missing also carry "missing": True.
+    """
+    titles = list(dict.fromkeys(titles))
+    chunks = [titles[i:i + WIKI_BATCH_SIZE] for i in range(0, len(titles), WIKI_BATCH_SIZE)]
+    out = {}
+    for part in await asyncio.gather(*[_afetch_batch(session, c, links) for c in chunks]):
+        out.update(part)
     return out
 
+async def asearch(session: aiohttp.ClientSession, query: str, results: int = 10) -> List[str]:
+    """Full-text search, equivalent to wikipedia.search(query, results=...)."""
+    params = {
+        "action": "query", "list": "search", "srsearch": query, "srlimit": results,
+        "srprop": "", "format": "json", "formatversion": "2",
+    }
+    data = await _wiki_get(session, params)
+    return [hit["title"] for hit in data.get("query", {}).get("search", [])]
+
+# ----- Cached wikipediaapi lookups -----
+# plain ints: the traversal loop compares against these instead of enum attributes
+_NS_MAIN = int(wikipediaapi.Namespace.MAIN)
+_NS_CAT = int(wikipediaapi.Namespace.CATEGORY)
+
+def _title_key(title: str) -> str:
+    # titles are case-sensitive past the first letter, so only fold whitespace/underscores
+    return " ".join(title.replace("_", " ").split())
+
+# expires with the on-disk caches; runs on the thread pool, hence the lock
+@cachetools.cached(cachetools.TTLCache(maxsize=4096, ttl=WIKI_CACHE_TTL), lock=threading.Lock())
+def _cached_catmembers(title: str) -> Tuple[Tuple[str, int], ...]:
+    """(member title, namespace) pairs of a category. Call with a _title_key()-normalized title."""
+    return tuple((m.title, int(m.ns)) for m in wiki_api.page(title).categorymembers.values())
+
 # ----- Wikipedia category traversal -----
-def get_category_members_recursive(catpage, max_depth=2, level=0):
-    """Return list of page titles under a category (recursively up to max_depth)."""
+def get_category_members_iter(cattitle: str, max_depth=2, max_results=200):
+    """
+    Return up to max_results page titles under a category, breadth-first down to max_depth.
+    Each category is visited once — Wikipedia's category graph has cycles.
+    """
+    queue = deque([(cattitle, 0)])
+    visited = set()
     results = []
-    if level > max_depth:
-        return results
-    for title, member in catpage.categorymembers.items():
-        # ns 0 = main/article pages (products etc.), ns 14 = category
-        if member.ns == wikipediaapi.Namespace.MAIN:
-            results.append(title)
-        elif member.ns == wikipediaapi.Namespace.CATEGORY:
-            # recurse into subcategory
-            results.extend(get_category_members_recursive(member, max_depth=max_depth, level=level+1))
-    return results
-
-def try_wikipedia_category_path(main: str, sub: str = None, subsub: str = None):
+    while queue and len(results) < max_results:
+        title, depth = queue.popleft()
+        key = _title_key(title)
+        if key in visited:
+            continue
+        visited.add(key)
+        for member, ns in _cached_catmembers(key):
+            # ns 0 = main/article pages (products etc.), ns 14 = category
+            if ns == _NS_MAIN:
+                results.append(member)
+            elif ns == _NS_CAT and depth < max_depth:
+                queue.append((member, depth + 1))
+    return results[:max_results]
+
+async def try_wikipedia_category_path(main: str, sub: str = None, subsub: str = None, max_results: int = 200,
+                                      errors: list = None):
     """
     Try several candidate category names built from the path.
     Returns list of found product names and a confidence measure (0-1).
+    Category traversal stops once max_results titles are collected.
+    Lookups that fail are skipped; pass `errors` to collect their exceptions.
     """
     candidates = []
     # Build common candidate category names
@@ -71,119 +312,248 @@ def try_wikipedia_category_path(main: str, sub: str = None, subsub: str = None):
 
     found_products = []
     best_conf = 0.0
-    for cand in unique_preserve_order(candidates):
+    session = _get_session()
+    candidates = unique_preserve_order(candidates)
+    # probe all category candidates in one query instead of one round-trip per guess
+    cat_candidates = [c for c in candidates if c.startswith("Category:") and _title_key(c) not in _NEG_CACHE]
+    try:
+        probes = await abatch_fetch_pages(session, cat_candidates, links=False)
+    except Exception as e:
+        _note_error(errors, e)
+        probes = {}
+    for cand, page in probes.items():
+        # only titles the API positively reported missing; error replies raise above
+        if page.get("missing"):
+            _NEG_CACHE[_title_key(cand)] = True
+    for cand in candidates:
         try:
             if cand.startswith("Category:"):
-                catname = cand[len("Category:"):]
-                catpage = wiki_api.page("Category:" + catname)
-                if catpage.exists():
-                    names = get_category_members_recursive(catpage, max_depth=2)
-                    if names:
-                        found_products.extend([(normalize_name(n), "wikipedia_category", cand) for n in names])
-                        best_conf = max(best_conf, 0.9)
-                        break  # prefer category results first
+                if not probes.get(cand, _MISSING_PAGE)["exists"]:
+                    continue
+                names = await _run_wiki_blocking(get_category_members_iter, cand, 2, max_results)
+                if names:
+                    found_products.extend([(normalize_name(n), "wikipedia_category", cand) for n in names])
+                    best_conf = max(best_conf, 0.9)
+                    break  # prefer category results first
             else:
                 # it's a "List of ..." page candidate — use wikipedia search + parse
-                search_results = wikipedia.search(cand, results=5)
+                search_results = await asearch(session, cand, results=5)
+                pages = await abatch_fetch_pages(session, search_results)
                 for title in search_results:
-                    try:
-                        page = wiki_api.page(title)
-                        if page.exists():
-                            # gather links on the page (often list items)
-                            text_links = list(page.links.keys())
-                            if len(text_links) >= 3:
-                                found_products.extend([(normalize_name(p), "wikipedia_list", title) for p in text_links])
-                                best_conf = max(best_conf, 0.85)
-                                break
-                    except Exception:
+                    page = pages[title]
+                    if not page["exists"]:
                         continue
+                    # gather links on the page (often list items)
+                    text_links = page["links"]
+                    if len(text_links) >= 3:
+                        found_products.extend([(normalize_name(p), "wikipedia_list", title) for p in text_links])
+                        best_conf = max(best_conf, 0.85)
+                        break
                 if found_products:
                     break
-        except Exception:
+        except Exception as e:
+            _note_error(errors, e)
             continue
     return found_products, best_conf
 
 # ----- Wikipedia search fallback -----
-def try_wikipedia_search(path_terms: List[str], max_results=10):
+async def try_wikipedia_search(path_terms: List[str], max_results=10, errors: list = None):
     """
     If category approach fails, search Wikipedia and extract plausible product names from top pages.
+    All result pages are fetched in a single batched query.
+    Lookups that fail are skipped; pass `errors` to collect their exceptions.
     """
     query = " ".join(path_terms)
-    titles = wikipedia.search(query, results=max_results)
-    out = []
+    session = _get_session()
+    try:
+        titles = await asearch(session, query, results=max_results)
+        pages = await abatch_fetch_pages(session, titles)
+    except Exception as e:
+        _note_error(errors, e)
+        return []
+    # raw title -> (source, source_ref) of its first occurrence; result pages link to
+    # each other heavily, so dedupe before normalizing
+    candidates = {}
     for t in titles:
-        try:
-            page = wiki_api.page(t)
-            if page.exists():
-                # if the page is likely a product (heuristic: contains year/model tokens or short page)
-                # collect links (sub-items) and the title itself
-                out.append((normalize_name(t), "wikipedia_search", query))
-                # also add page links as candidates
-                links = list(page.links.keys())[:40]
-                out.extend([(normalize_name(l), "wikipedia_search_link", t) for l in links])
-        except Exception:
+        page = pages.get(t, _MISSING_PAGE)
+        if not page["exists"]:
             continue
-    return out
+        # if the page is likely a product (heuristic: contains year/model tokens or short page)
+        # collect links (sub-items) and the title itself
+        candidates.setdefault(t, ("wikipedia_search", query))
+        # also add page links as candidates
+        for l in islice(page["links"], 40):
+            candidates.setdefault(l, ("wikipedia_search_link", t))
+    return [(normalize_name(raw), src, ref) for raw, (src, ref) in candidates.items()]
 
 # ----- Simple retailer page fallback (lightweight) -----
-def simple_retailer_fallback(category_url: str, css_selector_candidates: List[str] = None) -> List[str]:
+# retailer domains tolerate far more concurrency than the Wikipedia API
+_RETAIL_SEM = asyncio.Semaphore(50)
+
+_DEFAULT_SELECTORS = [
+    ".product-title", ".product-name", "h2 a", ".product-card__title", ".s-title"
+]
+
+async def simple_retailer_fallback(category_url: str, css_selector_candidates: List[str] = None,
+                                   errors: list = None) -> List[str]:
     """
     A minimal fallback to fetch product names from a provided category URL.
     css_selector_candidates is a list of selectors to try for product titles (e.g. ['.product-title', 'h2 a']).
+    Returns [] on failure; pass `errors` to collect the exception.
     This is intentionally small — for production, replace with Scrapy/Playwright spiders with site adapters.
     """
-    headers = {"User-Agent": "Mozilla/5.0 (compatible; product-extractor/1.0)"}
     try:
-        resp = requests.get(category_url, headers=headers, timeout=10)
+        async with _RETAIL_SEM:
+            resp = await _get_http().get(category_url)
         resp.raise_for_status()
-        soup = BeautifulSoup(resp.text, "html.parser")
-        selectors = css_selector_candidates or [
-            ".product-title", ".product-name", "h2 a", ".product-card__title", ".s-title"
-        ]
+        # raw bytes: let the parser detect the encoding itself
+        tree = HTMLParser(resp.content)
+        selectors = css_selector_candidates or _DEFAULT_SELECTORS
         names = []
         for sel in selectors:
-            for el in soup.select(sel):
-                text = el.get_text(strip=True)
+            for el in tree.css(sel):
+                text = el.text(strip=True)
                 if text:
                     names.append(normalize_name(text))
         return unique_preserve_order(names)
-    except Exception:
+    except Exception as e:
+        _note_error(errors, e)
         return []
 
 # ----- Main extractor function -----
-def extract_products_from_path(main: str, sub: str = None, subsub: str = None, retailer_url: str = None):
+def _merge(agg: Dict[str, Dict], name: str, src: str, ref: str, conf: float):
+    """Insert into the aggregate keyed by lower-cased name, keeping the best confidence."""
+    key = name.lower()
+    cur = agg.get(key)
+    if cur is None or conf > cur["confidence"]:
+        agg[key] = {"name": name, "source": src, "source_ref": ref, "confidence": conf}
+
+def _top_k(items, limit: int = None) -> List[Dict]:
+    """Items ordered by descending confidence (stable), cut to `limit` if given."""
+    if limit is not None and limit < 1:
+        return []
+    by_conf = itemgetter("confidence")
+    if limit and limit < len(items) // 2:
+        # O(N log K) when only a small head of the list is wanted
+        return heapq.nlargest(limit, items, key=by_conf)
+    return sorted(items, key=by_conf, reverse=True)[:limit]
+
+def _cache_result(key: str, items: List[Dict], errors: list):
+    # a degraded or empty aggregate would otherwise be served (and persisted) for a whole TTL
+    if items and not errors:
+        _RESULT_CACHE[key] = (time.time(), items)
+
+def _discard(tasks):
+    """Cancel unfinished tasks; mark finished ones' results as seen so asyncio doesn't warn."""
+    for t in tasks:
+        if not t.done():
+            t.cancel()
+        elif not t.cancelled():
+            t.exception()
+
+async def _stage_batches(main: str, sub: str = None, subsub: str = None, retailer_url: str = None,
+                         errors: list = None):
     """
-    Returns list of dicts: { name, source, source_ref, confidence }
+    Async generator of per-stage (name, source, source_ref, confidence) lists, in stage order.
+    Stage confidences only go down (0.9/0.85, 0.7, 0.6), so the first occurrence of a name is its best.
+    Failures the stages degraded around are appended to `errors`.
     """
     path_terms = [t for t in [main, sub, subsub] if t]
-    results = []
+    # The stages don't depend on each other, so start them all at once: wall-clock is the
+    # slowest stage instead of their sum. 1) Wikipedia category path heuristics,
+    # 2) Wikipedia search fallback, 3) minimal retailer fallback if user provided a category URL
+    category_task = asyncio.create_task(try_wikipedia_category_path(main, sub, subsub, errors=errors))
+    # fallback failures only matter if their results are used
+    fallback_errors = []
+    fallback_tasks = [asyncio.create_task(try_wikipedia_search(path_terms, max_results=5, errors=fallback_errors))]
+    if retailer_url:
+        fallback_tasks.append(asyncio.create_task(simple_retailer_fallback(retailer_url, errors=fallback_errors)))
+    try:
+        wiki_items, conf = await category_task
+        yield [(name, src, ref, 0.9 if src == "wikipedia_category" else 0.85) for name, src, ref in wiki_items]
 
-    # 1) Wikipedia category path heuristics
-    wiki_items, conf = try_wikipedia_category_path(main, sub, subsub)
-    for name, src, ref in wiki_items:
-        results.append({"name": name, "source": src, "source_ref": ref, "confidence": 0.9 if src == "wikipedia_category" else 0.85})
-
-    if len(results) < 10:
-        # 2) Wikipedia search fallback
-        search_items = try_wikipedia_search(path_terms, max_results=5)
-        for name, src, ref in search_items:
-            results.append({"name": name, "source": src, "source_ref": ref, "confidence": 0.7})
-
-    if len(results) < 10 and retailer_url:
-        # 3) Minimal retailer fallback if user provided a category URL
-        retailer_names = simple_retailer_fallback(retailer_url)
-        for n in retailer_names:
-            results.append({"name": n, "source": "retailer_fallback", "source_ref": retailer_url, "confidence": 0.6})
-
-    # Normalize, dedupe, aggregate best confidences
-    agg = {}
-    for item in results:
-        key = item["name"].lower()
-        if key not in agg or item["confidence"] > agg[key]["confidence"]:
-            agg[key] = {"name": item["name"], "source": item["source"], "source_ref": item["source_ref"], "confidence": item["confidence"]}
-
-    final = sorted(agg.values(), key=lambda x: -x["confidence"])
-    return final
+        # fallbacks only count when the category stage comes up short; otherwise they're cancelled below
+        if len({name.lower() for name, _, _ in wiki_items}) < 10:
+            yield [(name, src, ref, 0.7) for name, src, ref in await fallback_tasks[0]]
+            if retailer_url:
+                yield [(n, "retailer_fallback", retailer_url, 0.6) for n in await fallback_tasks[1]]
+            if errors is not None:
+                errors.extend(fallback_errors)
+    finally:
+        _discard([category_task, *fallback_tasks])
+
+async def extract_products_from_path(main: str, sub: str = None, subsub: str = None, retailer_url: str = None,
+                                     limit: int = None):
+    """
+    Returns list of dicts: { name, source, source_ref, confidence },
+    best confidence first, at most `limit` of them if given.
+    """
+    key = _result_key(main, sub, subsub, retailer_url)
+    cached = _RESULT_CACHE.get(key)
+    # entries reloaded from disk get a fresh TTL in memory, so also check their original age
+    if cached is not None and time.time() - cached[0] < RESULT_CACHE_TTL:
+        return _top_k(cached[1], limit)
+
+    # Normalized names are deduped and aggregated to their best confidence as they come in
+    agg: Dict[str, Dict] = {}
+    errors = []
+    async with aclosing(_stage_batches(main, sub, subsub, retailer_url, errors)) as batches:
+        async for batch in batches:
+            for name, src, ref, conf in batch:
+                _merge(agg, name, src, ref, conf)
+
+    items = list(agg.values())
+    _cache_result(key, items, errors)
+    return _top_k(items, limit)
+
+async def extract_products_stream(main: str, sub: str = None, subsub: str = None, retailer_url: str = None,
+                                  limit: int = None, errors: list = None):
+    """
+    Same items and order as extract_products_from_path, but yielded as soon as each stage
+    finishes instead of after the whole aggregation.
+    Failures the stages degraded around are appended to `errors`.
+    """
+    if limit is not None and limit < 1:
+        return
+    key = _result_key(main, sub, subsub, retailer_url)
+    cached = _RESULT_CACHE.get(key)
+    if cached is not None and time.time() - cached[0] < RESULT_CACHE_TTL:
+        for item in _top_k(cached[1], limit):
+            yield item
+        return
+
+    agg: Dict[str, Dict] = {}
+    if errors is None:
+        errors = []
+    # aclosing: an early return (or a client disconnect) must cancel the stage tasks now,
+    # not whenever the event loop finalizes the suspended generator
+    async with aclosing(_stage_batches(main, sub, subsub, retailer_url, errors)) as batches:
+        async for batch in batches:
+            for name, src, ref, conf in batch:
+                # stages arrive best-confidence first, so a name's first occurrence is final
+                if name.lower() in agg:
+                    continue
+                _merge(agg, name, src, ref, conf)
+                yield agg[name.lower()]
+                if limit is not None and len(agg) >= limit:
+                    return  # partial aggregate: don't cache it
+
+    _cache_result(key, list(agg.values()), errors)
+
+async def _ndjson(items, errors: list):
+    """
+    Encode products as NDJSON. The 200 status is already sent by the time a stage can fail,
+    so failures are reported in-band: if any stage degraded, or the stream broke off, the
+    last line is {"error": [...]} and the products above it may be incomplete.
+    """
+    try:
+        async with aclosing(items):
+            async for item in items:
+                yield orjson.dumps(item) + b"\n"
+    except Exception as e:
+        errors.append(e)
+    if errors:
+        yield orjson.dumps({"error": [f"{type(e).__name__}: {e}" for e in errors]}) + b"\n"
 
 # ----- FastAPI models and endpoint -----
 class ExtractRequest(BaseModel):
@@ -191,17 +561,36 @@ class ExtractRequest(BaseModel):
     sub: str = None
     subsub: str = None
     retailer_url: str = None  # optional fallback url to try
+    limit: int = Field(None, ge=1)  # optional cap on returned products (highest confidence first)
 
 @app.post("/extract")
-def extract(req: ExtractRequest):
-    names = extract_products_from_path(req.main, req.sub, req.subsub, req.retailer_url)
+async def extract(req: ExtractRequest):
+    names = await extract_products_from_path(req.main, req.sub, req.subsub, req.retailer_url, req.limit)
     return {"category_path": [req.main, req.sub, req.subsub], "count": len(names), "products": names}
 
 @app.get("/extract")
-def extract_get(main: str = Query(...), sub: str = Query(None), subsub: str = Query(None), retailer_url: str = Query(None)):
-    names = extract_products_from_path(main, sub, subsub, retailer_url)
+async def extract_get(main: str = Query(...), sub: str = Query(None), subsub: str = Query(None), retailer_url: str = Query(None),
+                      limit: int = Query(None, ge=1)):
+    names = await extract_products_from_path(main, sub, subsub, retailer_url, limit)
     return {"category_path": [main, sub, subsub], "count": len(names), "products": names}
 
+@app.post("/extract/stream")
+async def extract_stream(req: ExtractRequest):
+    """
+    Newline-delimited JSON products, best confidence first, streamed as stages complete.
+    A final {"error": [...]} line means some lookups failed and the list may be incomplete.
+    """
+    errors = []
+    items = extract_products_stream(req.main, req.sub, req.subsub, req.retailer_url, req.limit, errors)
+    return StreamingResponse(_ndjson(items, errors), media_type="application/x-ndjson")
+
+@app.get("/extract/stream")
+async def extract_stream_get(main: str = Query(...), sub: str = Query(None), subsub: str = Query(None), retailer_url: str = Query(None),
+                             limit: int = Query(None, ge=1)):
+    errors = []
+    items = extract_products_stream(main, sub, subsub, retailer_url, limit, errors)
+    return StreamingResponse(_ndjson(items, errors), media_type="application/x-ndjson")
+
 # ----- quick test runner -----
 if __name__ == "__main__":
     # quick CLI demo
@@ -212,9 +601,21 @@ if __name__ == "__main__":
     parser.add_argument("--sub")
     parser.add_argument("--subsub")
     parser.add_argument("--retailer_url")
+    parser.add_argument("--limit", type=int, help="Only keep the N highest-confidence products")
     parser.add_argument("--output", help="Output JSON file path (default: auto-generated)")
     args = parser.parse_args()
-    res = extract_products_from_path(args.main, args.sub, args.subsub, args.retailer_url)
+    if args.limit is not None and args.limit < 1:
+        parser.error("--limit must be at least 1")
+
+    async def _run():
+        _load_result_cache()
+        try:
+            return await extract_products_from_path(args.main, args.sub, args.subsub, args.retailer_url, args.limit)
+        finally:
+            await _close_clients()
+            _dump_result_cache()
+
+    res = asyncio.run(_run())
     
     # Generate output filename if not provided
     if args.output:
@@ -226,10 +627,12 @@ if __name__ == "__main__":
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         output_file = f"output_{category_str}_{timestamp}.json"
     
-    # Save to JSON file
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(res, f, indent=2, ensure_ascii=False)
+    # Save to JSON file (orjson emits UTF-8 bytes directly)
+    output = orjson.dumps(res, option=orjson.OPT_INDENT_2)
+    with open(output_file, 'wb') as f:
+        f.write(output)
     
     print(f"Results saved to: {output_file}")
     print(f"Total products found: {len(res)}")
+    # stdout stays ASCII-escaped so non-UTF-8 consoles (e.g. cp1252 on Windows) can print it
     print(json.dumps(res, indent=2))